@@ -1,8 +1,17 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from utils.data_utils import load_data, compute_statistics, filter_data, export_data
+from utils.data_utils import (
+    DEFAULT_SAMPLE_PATH, load_data, compute_student_aggregates, compute_statistics, compute_correlation,
+    compute_subject_summary, filter_data, unique_sorted, export_csv, export_excel
+)
+
+# Boxplot points: SVG up to SVG_POINTS_LIMIT students, WebGL up to
+# BOX_POINTS_LIMIT, outliers only beyond that
+SVG_POINTS_LIMIT = 500
+BOX_POINTS_LIMIT = 1000
 
 # ---- PAGE CONFIG ----
 st.set_page_config(
@@ -29,17 +38,28 @@ st.markdown(
 st.sidebar.header("📂 Data / Filters")
 uploaded_file = st.sidebar.file_uploader("Upload marks CSV or Excel", type=["csv", "xlsx"])
 
+def store_data(df, source):
+    """Augment the loaded frame once and keep it plus its (constant) filter options in session state"""
+    # Only numeric subject columns for charts (exclude Total, Percentage, StudentID, Class)
+    subject_cols = [c for c in df.select_dtypes(include="number").columns
+                    if c not in ["Total", "Percentage", "StudentID"]]
+    if subject_cols:
+        df = compute_student_aggregates(df, subject_cols)
+    st.session_state["data"] = df
+    st.session_state["subject_cols"] = subject_cols
+    st.session_state["source"] = source
+    st.session_state["class_options"] = unique_sorted(df, "Class")
+    st.session_state["section_options"] = unique_sorted(df, "Section")
+
 # Load sample data or uploaded file
 if st.sidebar.button("📥 Load sample data"):
-    df = load_data("data/sample_marks.csv")
-    st.session_state["data"] = df
+    with open(DEFAULT_SAMPLE_PATH, "rb") as f:
+        df = load_data(f.read(), DEFAULT_SAMPLE_PATH)
+    store_data(df, DEFAULT_SAMPLE_PATH)
     st.sidebar.success("✅ Sample data loaded.")
-elif uploaded_file:
-    if uploaded_file.name.endswith(".csv"):
-        df = load_data(uploaded_file)
-    elif uploaded_file.name.endswith(".xlsx"):
-        df = pd.read_excel(uploaded_file)
-    st.session_state["data"] = df
+elif uploaded_file and st.session_state.get("source") != uploaded_file.file_id:
+    df = load_data(uploaded_file.getvalue(), uploaded_file.name)
+    store_data(df, uploaded_file.file_id)
 
 df = st.session_state.get("data")
 
@@ -48,20 +68,16 @@ if df is None:
     st.stop()
 
 # ---- PROCESS DATA ----
-# Only numeric subject columns for charts (exclude Total, Percentage, StudentID, Class)
-subject_cols = [c for c in df.select_dtypes(include="number").columns 
-                if c not in ["Total", "Percentage", "StudentID"]]
+# Total / Percentage / Grade were added once in store_data when the file was loaded
+subject_cols = st.session_state["subject_cols"]
 
 if len(subject_cols) == 0:
     st.error("No numeric subject columns detected. Please upload a CSV/Excel with marks as numbers.")
     st.stop()
 
-df["Total"] = df[subject_cols].sum(axis=1)
-df["Percentage"] = df["Total"] / (len(subject_cols) * 100) * 100
-
 # ---- FILTERS ----
-class_options = ["All"] + sorted(df["Class"].unique().tolist()) if "Class" in df.columns else ["All"]
-section_options = ["All"] + sorted(df["Section"].unique().tolist()) if "Section" in df.columns else ["All"]
+class_options = st.session_state["class_options"]
+section_options = st.session_state["section_options"]
 
 sel_class = st.sidebar.selectbox("🏫 Select Class", class_options) if "Class" in df.columns else "All"
 sel_section = st.sidebar.selectbox("🧑‍🤝‍🧑 Select Section", section_options) if "Section" in df.columns else "All"
@@ -88,48 +104,83 @@ with kpi4:
 st.markdown("---")
 
 # ---- CHARTS ----
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("📊 Subject-wise Average Marks")
-    avg_df = df_filtered[subject_cols].mean().reset_index()
-    avg_df.columns = ["Subject", "Average Marks"]
-    avg_chart = px.bar(
-        avg_df,
-        x="Subject",
-        y="Average Marks",
-        color="Average Marks",
-        color_continuous_scale="Blues",
-        labels={"Average Marks": "Average Marks"}
-    )
-    st.plotly_chart(avg_chart, use_container_width=True)
-
-    st.subheader("📈 Percentage Distribution")
-    hist_chart = px.histogram(
-        df_filtered, x="Percentage", nbins=10,
-        color_discrete_sequence=["#3498db"]
-    )
-    st.plotly_chart(hist_chart, use_container_width=True)
-
-with col2:
-    st.subheader("📦 Boxplot of Marks")
-    box_df = df_filtered[subject_cols].melt(var_name="Subject", value_name="Marks")
-    box_chart = px.box(
-        box_df,
-        x="Subject",
-        y="Marks",
-        points="all",
-        color_discrete_sequence=["#2ecc71"]
-    )
-    st.plotly_chart(box_chart, use_container_width=True)
-
-    st.subheader("🔗 Subject Correlation Heatmap")
-    corr = df_filtered[subject_cols].corr()
-    heatmap = go.Figure(data=go.Heatmap(
-        z=corr.values, x=corr.columns, y=corr.columns, colorscale="Blues"
-    ))
-    heatmap.update_layout(margin=dict(l=40, r=40, t=40, b=40))
-    st.plotly_chart(heatmap, use_container_width=True)
+def render_charts(df_filtered, subject_cols):
+    # Materialize the filtered subject matrix once and derive every chart from it
+    M = df_filtered[subject_cols].to_numpy(dtype=np.float32)
+    summary = compute_subject_summary(M, subject_cols)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("📊 Subject-wise Average Marks")
+        avg_df = pd.DataFrame({"Subject": subject_cols, "Average Marks": summary.loc["mean"].to_numpy()})
+        avg_chart = px.bar(
+            avg_df,
+            x="Subject",
+            y="Average Marks",
+            color="Average Marks",
+            color_continuous_scale="Blues",
+            labels={"Average Marks": "Average Marks"}
+        )
+        st.plotly_chart(avg_chart, use_container_width=True)
+
+        st.subheader("📈 Percentage Distribution")
+        # Pre-bin on the server so the browser only receives 10 bars
+        # 0-100 bins, widened if any percentage falls outside that range
+        pcts = df_filtered["Percentage"].to_numpy()
+        hist_range = (min(0, pcts.min()), max(100, pcts.max())) if pcts.size else (0, 100)
+        counts, edges = np.histogram(pcts, bins=10, range=hist_range)
+        hist_chart = go.Figure(data=go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+            marker_color="#3498db"
+        ))
+        hist_chart.update_layout(xaxis_title="Percentage", yaxis_title="count", bargap=0)
+        st.plotly_chart(hist_chart, use_container_width=True)
+
+    with col2:
+        st.subheader("📦 Boxplot of Marks")
+        # One trace per subject straight from the matrix columns, no long-form reshape.
+        # Small rosters draw points as SVG, medium ones via a WebGL overlay,
+        # large ones only show outliers.
+        n_students = len(df_filtered)
+        use_gl_points = SVG_POINTS_LIMIT < n_students <= BOX_POINTS_LIMIT
+        if n_students <= SVG_POINTS_LIMIT:
+            box_points = "all"
+        elif use_gl_points:
+            box_points = False
+        else:
+            box_points = "outliers"
+        box_chart = go.Figure()
+        for j, subject in enumerate(subject_cols):
+            box_chart.add_trace(go.Box(
+                y=M[:, j], x0=j, name=subject, boxpoints=box_points,
+                marker_color="#2ecc71", showlegend=False
+            ))
+        if use_gl_points:
+            jitter = np.random.default_rng(0).uniform(-0.2, 0.2, M.size)
+            box_chart.add_trace(go.Scattergl(
+                x=np.repeat(np.arange(len(subject_cols)), n_students) + jitter,
+                y=M.ravel(order="F"), mode="markers", hoverinfo="y",
+                marker=dict(color="#2ecc71", size=4, opacity=0.5), showlegend=False
+            ))
+        box_chart.update_layout(
+            xaxis=dict(title="Subject", tickvals=list(range(len(subject_cols))), ticktext=subject_cols),
+            yaxis_title="Marks"
+        )
+        st.plotly_chart(box_chart, use_container_width=True)
+
+        st.subheader("🔗 Subject Correlation Heatmap")
+        corr = compute_correlation(M)
+        heatmap = go.Figure(data=go.Heatmap(
+            z=corr, x=subject_cols, y=subject_cols, colorscale="Blues"
+        ))
+        heatmap.update_layout(margin=dict(l=40, r=40, t=40, b=40))
+        st.plotly_chart(heatmap, use_container_width=True)
+
+    st.subheader("📋 Subject-wise Statistics")
+    st.dataframe(summary.T.round(2), use_container_width=True)
+
+render_charts(df_filtered, subject_cols)
 
 # ---- TOP STUDENTS ----
 st.subheader("🏆 Top Students")
@@ -139,51 +190,59 @@ if "StudentID" in df_filtered.columns:
 if "Class" in df_filtered.columns:
     top_cols.insert(1, "Class")
 
-st.dataframe(
-    df_filtered[top_cols].sort_values(by="Percentage", ascending=False).head(top_n),
-    use_container_width=True
-)
+# filter_data already keeps the top N rows in descending Percentage order
+st.dataframe(df_filtered[top_cols], use_container_width=True)
 
 # ---- STUDENT DETAIL VIEW ----
-st.markdown("## 👤 Student Detail View")
-student_sel = st.selectbox("🔍 Select a student", df_filtered["Name"].unique())
-
-if student_sel:
-    student_data = df_filtered[df_filtered["Name"] == student_sel].iloc[0]
-
-    st.markdown(
-        f"""
-        **🧑 Name:** {student_data['Name']}  
-        **🏫 Class:** {student_data.get('Class', 'N/A')}  
-        **📌 Section:** {student_data.get('Section', 'N/A')}  
-        **📊 Total Marks:** {student_data['Total']}  
-        **📈 Percentage:** {student_data['Percentage']:.2f}%  
-        **🎯 Grade:** {student_data.get('Grade', 'N/A')}  
-        """
-    )
-
-    radar = go.Figure()
-    radar.add_trace(go.Scatterpolar(
-        r=student_data[subject_cols].values,
-        theta=subject_cols,
-        fill="toself",
-        name=student_sel,
-        marker=dict(color="#e74c3c")
-    ))
-    radar.update_layout(
-        polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-        showlegend=False,
-        margin=dict(l=30, r=30, t=30, b=30)
-    )
-    st.plotly_chart(radar, use_container_width=True)
+@st.fragment
+def render_student_detail(df_filtered, subject_cols, name_idx):
+    st.markdown("## 👤 Student Detail View")
+    student_sel = st.selectbox("🔍 Select a student", list(name_idx))
+
+    if student_sel:
+        student_data = df_filtered.iloc[name_idx[student_sel]]
+
+        st.markdown(
+            f"""
+            **🧑 Name:** {student_data['Name']}  
+            **🏫 Class:** {student_data.get('Class', 'N/A')}  
+            **📌 Section:** {student_data.get('Section', 'N/A')}  
+            **📊 Total Marks:** {student_data['Total']}  
+            **📈 Percentage:** {student_data['Percentage']:.2f}%  
+            **🎯 Grade:** {student_data.get('Grade', 'N/A')}  
+            """
+        )
+
+        radar = go.Figure()
+        radar.add_trace(go.Scatterpolar(
+            r=student_data[subject_cols].values,
+            theta=subject_cols,
+            fill="toself",
+            name=student_sel,
+            marker=dict(color="#e74c3c")
+        ))
+        radar.update_layout(
+            polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+            showlegend=False,
+            margin=dict(l=30, r=30, t=30, b=30)
+        )
+        st.plotly_chart(radar, use_container_width=True)
+
+# Name -> first row position, built once per full run; fragment reruns reuse it
+name_idx = {}
+for i, name in enumerate(df_filtered["Name"].to_numpy()):
+    name_idx.setdefault(name, i)
+
+render_student_detail(df_filtered, subject_cols, name_idx)
 
 # ---- EXPORT ----
 st.markdown("## ⬇️ Export Data")
-csv_data, excel_data = export_data(df_filtered)
-
 col_csv, col_excel = st.columns(2)
 with col_csv:
-    st.download_button("📥 Download CSV", csv_data, file_name="students_filtered.csv", mime="text/csv")
+    st.download_button("📥 Download CSV", export_csv(df_filtered), file_name="students_filtered.csv",
+                       mime="text/csv")
 with col_excel:
-    st.download_button("📥 Download Excel", excel_data, file_name="students_filtered.xlsx",
-                       mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    # Building the workbook is the slow part, so only do it when asked
+    if st.button("🛠 Prepare Excel"):
+        st.download_button("📥 Download Excel", export_excel(df_filtered), file_name="students_filtered.xlsx",
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
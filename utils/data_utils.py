@@ -3,43 +3,91 @@ Utilities for loading and processing student marks data.
 """
 
 import io
-from typing import List, Union
+from typing import List
+import numpy as np
 import pandas as pd
+import streamlit as st
 from pandas import DataFrame
 
 DEFAULT_SAMPLE_PATH = "data/sample_marks.csv"
 
-def load_data(path_or_buffer: Union[str, io.BytesIO]) -> DataFrame:
-    """Load CSV into DataFrame and ensure StudentID + Name exist"""
-    df = pd.read_csv(path_or_buffer)
+CATEGORY_COLS = ["Class", "Section"]
+
+GRADE_BINS = np.array([40, 50, 60, 70, 80, 90])
+GRADE_LABELS = np.array(["F", "D", "C", "B", "B+", "A", "A+"])
+
+def load_excel(file_bytes: bytes) -> DataFrame:
+    """Parse Excel bytes into DataFrame (cached through load_data)"""
+    try:
+        # Rust-based reader, much faster than openpyxl (pandas >= 2.2)
+        return pd.read_excel(io.BytesIO(file_bytes), engine="calamine")
+    except (ImportError, ValueError):
+        return pd.read_excel(io.BytesIO(file_bytes), engine="openpyxl")
+
+@st.cache_data(show_spinner=False)
+def load_data(file_bytes: bytes, name: str) -> DataFrame:
+    """Load CSV/Excel bytes into DataFrame and ensure StudentID + Name exist"""
+    if name.endswith(".xlsx"):
+        df = load_excel(file_bytes)
+    else:
+        try:
+            # Arrow's multi-threaded reader; streamlit already depends on pyarrow
+            df = pd.read_csv(io.BytesIO(file_bytes), engine="pyarrow")
+        except (ImportError, ValueError):
+            df = pd.read_csv(io.BytesIO(file_bytes))
     if "StudentID" not in df.columns:
         df.insert(0, "StudentID", range(1, len(df) + 1))
     if "Name" not in df.columns:
         df.insert(1, "Name", [f"Student {i}" for i in range(1, len(df) + 1)])
     df.columns = df.columns.str.strip()
+    return downcast_columns(df)
+
+def downcast_columns(df: DataFrame) -> DataFrame:
+    """Shrink integer marks to int16 and label columns to category"""
+    for c in df.select_dtypes(include="number").columns:
+        if (pd.api.types.is_integer_dtype(df[c]) and df[c].max() <= 100
+                and df[c].min() >= np.iinfo(np.int16).min):
+            df[c] = df[c].astype(np.int16)
+    for c in CATEGORY_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
     return df
 
+def unique_sorted(df: DataFrame, col: str) -> list:
+    """Dropdown options for a column: "All" followed by its sorted values"""
+    if col not in df.columns:
+        return ["All"]
+    return ["All"] + sorted(df[col].dropna().unique().tolist())
+
+@st.cache_data(show_spinner=False)
 def compute_student_aggregates(df: DataFrame, subject_cols: List[str], treat_missing_as_zero=True) -> DataFrame:
-    """Compute Total, Percentage, and Grade for students"""
+    """Compute Total, Percentage, and Grade (unless the data already has one) for students"""
     df = df.copy()
     for s in subject_cols:
         if s not in df.columns:
             df[s] = 0.0
+    # Fractional marks keep a fractional Total (rounded like Percentage) so the two agree
+    int_marks = all(pd.api.types.is_integer_dtype(df[s]) for s in subject_cols)
     if treat_missing_as_zero:
-        marks = df[subject_cols].fillna(0.0)
-        total = marks.sum(axis=1)
-        max_total = 100 * len(subject_cols)
-        percentage = total / max_total * 100
+        # One pass over the subject matrix; NaN marks count as 0
+        total = np.nansum(df[subject_cols].to_numpy(dtype=np.float64), axis=1)
+        percentage = total / len(subject_cols)
     else:
         total = df[subject_cols].sum(axis=1, skipna=True)
         counts = df[subject_cols].count(axis=1)
         percentage = total / (counts * 100) * 100
         percentage = percentage.fillna(0)
-    df["Total"] = total.astype(int)
+    df["Total"] = total.astype(int) if int_marks else total.round(2)
     df["Percentage"] = percentage.round(2)
-    df["Grade"] = df["Percentage"].apply(grade_from_percentage)
+    if "Grade" not in df.columns:
+        df["Grade"] = grades_from_percentages(df["Percentage"].to_numpy())
     return df
 
+def grades_from_percentages(pcts: np.ndarray) -> np.ndarray:
+    """Vectorized grade mapping (same buckets as grade_from_percentage)"""
+    pcts = np.nan_to_num(np.asarray(pcts, dtype=float), nan=0.0)
+    return GRADE_LABELS[np.searchsorted(GRADE_BINS, pcts, side="right")]
+
 def grade_from_percentage(pct: float) -> str:
     """Grade mapping from percentage"""
     try:
@@ -54,41 +102,62 @@ def grade_from_percentage(pct: float) -> str:
     if pct >= 40: return "D"
     return "F"
 
+@st.cache_data(show_spinner=False)
 def compute_statistics(df: DataFrame) -> dict:
     """Compute overall KPIs (always returns the keys)"""
     if df.empty or "Percentage" not in df.columns:
         return {"avg": 0, "median": 0, "highest": 0, "pass_rate": 0}
 
-    avg = df["Percentage"].mean()
-    median = df["Percentage"].median()
-    highest = df["Percentage"].max()
-    pass_rate = (df["Percentage"] >= 40).mean() * 100
-
+    p = df["Percentage"].to_numpy(dtype=np.float64)
     return {
-        "avg": round(avg, 2),
-        "median": round(median, 2),
-        "highest": round(highest, 2),
-        "pass_rate": round(pass_rate, 2)
+        "avg": float(p.mean()),
+        "median": float(np.median(p)),
+        "highest": float(p.max()),
+        "pass_rate": float((p >= 40).mean() * 100)
     }
 
+@st.cache_data(show_spinner=False)
+def compute_correlation(marks: np.ndarray) -> np.ndarray:
+    """Subject correlation matrix for a (students x subjects) marks array"""
+    if np.isnan(marks).any():
+        # Missing marks: use pandas' pairwise-complete correlation
+        return DataFrame(marks).corr().to_numpy()
+    return np.atleast_2d(np.corrcoef(marks, rowvar=False))
+
+@st.cache_data(show_spinner=False)
+def compute_subject_summary(marks: np.ndarray, subject_cols: List[str]) -> DataFrame:
+    """Per-subject mean/min/quartiles/max from a (students x subjects) marks array"""
+    index = ["mean", "min", "25%", "50%", "75%", "max"]
+    if marks.shape[0] == 0:
+        return DataFrame(np.nan, index=index, columns=subject_cols)
+    quantiles = np.nanpercentile(marks, [0, 25, 50, 75, 100], axis=0)
+    summary = np.vstack([np.nanmean(marks, axis=0), quantiles])
+    return DataFrame(summary, index=index, columns=subject_cols)
+
+@st.cache_data(show_spinner=False)
 def filter_data(df: DataFrame, sel_class="All", sel_section="All", min_percent=0, top_n=None) -> DataFrame:
     """Filter by class, section, min % and top N"""
-    filtered = df.copy()
-    if sel_class != "All" and "Class" in filtered.columns:
-        filtered = filtered[filtered["Class"] == sel_class]
-    if sel_section != "All" and "Section" in filtered.columns:
-        filtered = filtered[filtered["Section"] == sel_section]
-    if min_percent > 0 and "Percentage" in filtered.columns:
-        filtered = filtered[filtered["Percentage"] >= min_percent]
+    mask = np.ones(len(df), dtype=bool)
+    if sel_class != "All" and "Class" in df.columns:
+        mask &= (df["Class"] == sel_class).to_numpy()
+    if sel_section != "All" and "Section" in df.columns:
+        mask &= (df["Section"] == sel_section).to_numpy()
+    if min_percent > 0 and "Percentage" in df.columns:
+        mask &= (df["Percentage"] >= min_percent).to_numpy()
+    filtered = df.loc[mask]
     if top_n and "Percentage" in filtered.columns:
-        filtered = filtered.sort_values(by="Percentage", ascending=False).head(int(top_n))
+        filtered = filtered.nlargest(int(top_n), "Percentage")
     return filtered
 
-def export_data(df: DataFrame):
-    """Return CSV + Excel bytes"""
-    csv_data = df.to_csv(index=False).encode("utf-8")
+def export_csv(df: DataFrame) -> bytes:
+    """Return CSV bytes"""
+    output = io.BytesIO()
+    df.to_csv(output, index=False, encoding="utf-8")
+    return output.getvalue()
+
+def export_excel(df: DataFrame) -> bytes:
+    """Return Excel bytes (slow; build only on request)"""
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine="openpyxl") as writer:
         df.to_excel(writer, index=False, sheet_name="Students")
-    excel_data = output.getvalue()
-    return csv_data, excel_data
+    return output.getvalue()